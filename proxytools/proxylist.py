@@ -35,6 +35,8 @@ class ProxyList:
         self.min_size = min_size
         self.max_fail = max_fail
         self.max_simultaneous = max_simultaneous
+        # Lowered simultaneous use limits for failing proxies, see _adjust_simultaneous
+        self.simultaneous = {}
         self.success_timeout = success_timeout
         self.fail_timeout = fail_timeout
         self.history = history
@@ -209,6 +211,7 @@ class ProxyList:
         proxy.fail += 1
         proxy.in_use -= 1
         assert proxy.in_use >= 0
+        self._adjust_simultaneous(proxy, success=False)
         reason = ((exc is not None and repr(exc)) or
                   (resp is not None and repr_response(resp, full=debug)) or None)
         if self.history:
@@ -228,12 +231,14 @@ class ProxyList:
                     self._proxy_ready_notify_at(proxy.rest_till)
                 else:
                     self.proxy_ready.set()
-                    sleep(0)  # switch to other greenlet for fair play
+                    if self.waiting:
+                        sleep(0)  # hand off to waiting greenlets for fair play
 
     def blacklist(self, proxy, load=False):
         proxy.blacklist = True
         if proxy.addr in self.active_proxies:
             del self.active_proxies[proxy.addr]
+        self.simultaneous.pop(proxy.addr, None)
         self.blacklist_proxies[proxy.addr] = proxy
         self.clear_pool_manager(proxy)
         if not load:
@@ -260,6 +265,7 @@ class ProxyList:
         proxy.fail = 0
         proxy.in_use -= 1
         assert proxy.in_use >= 0
+        self._adjust_simultaneous(proxy, success=True)
         if self.history:
             proxy.set_history(proxy.success_at, PROXY_RESULT_TYPE.SUCCESS,
                               resp is not None and repr_response(resp) or None,
@@ -270,7 +276,8 @@ class ProxyList:
             self._proxy_ready_notify_at(proxy.rest_till)
         else:
             self.proxy_ready.set()
-            sleep(0)  # switch to other greenlet for fair play
+            if self.waiting:
+                sleep(0)  # hand off to waiting greenlets for fair play
 
     def rest(self, proxy, timeout, resp=None, request_ident=None, debug=False):
         proxy.success_at = datetime.utcnow()
@@ -287,17 +294,42 @@ class ProxyList:
                      request_ident and ' ' + request_ident or '',
                      reason and ' ' + reason or '', proxy.rest_till, self._stats_str)
 
+    def _adjust_simultaneous(self, proxy, success):
+        # AIMD (additive increase, multiplicative decrease) of proxy simultaneous use,
+        # so failing proxies hold less connections in their pool managers.
+        # NOTE: with default max_simultaneous=2 limit is only 1 or 2, so fail
+        # halves it to 1 and next success restores it
+        limit = self.simultaneous.get(proxy.addr, self.max_simultaneous)
+        if success:
+            limit = min(limit + 1, self.max_simultaneous)
+        else:
+            limit = max(limit // 2, 1)
+        if limit < self.max_simultaneous:
+            self.simultaneous[proxy.addr] = limit
+        else:
+            self.simultaneous.pop(proxy.addr, None)
+
+    def release(self, proxy):
+        # Release proxy without result, for example if request was interrupted
+        proxy.in_use -= 1
+        assert proxy.in_use >= 0
+        self.proxy_ready.set()
+
     @property
     def in_use(self):
         return sum([p.in_use for p in self.active_proxies.values()])
 
     def get_ready_proxies(self, exclude=[], countries=None, countries_exclude=None,
-                          min_speed=None):
+                          min_speed=None, addrs=None):
+        # addrs limits check to specified proxies instead of all active
         now = datetime.utcnow()
+        proxies = (self.active_proxies.items() if addrs is None else
+                   ((addr, self.active_proxies[addr]) for addr in addrs
+                    if addr in self.active_proxies))
         return {
             addr: p
-            for addr, p in self.active_proxies.items()
-            if p.in_use < self.max_simultaneous and
+            for addr, p in proxies
+            if p.in_use < self.simultaneous.get(addr, self.max_simultaneous) and
             addr not in exclude and
             (not p.rest_till or p.rest_till < now) and
             (not countries or p.country in countries) and
@@ -323,6 +355,13 @@ class ProxyList:
                                       .format(self._stats_str))
         self.maybe_update()
 
+        if persist:
+            # fast path, not filtering all active proxies if persisted one is ready
+            proxy = self.get_ready_proxies(addrs=(persist,), **proxy_params).get(persist)
+            if proxy:
+                proxy.in_use += 1
+                return proxy
+
         ident = get_ident()  # unique integer id for greenlet
         while True:
             ready_proxies = self.get_ready_proxies(**proxy_params)
@@ -1,18 +1,24 @@
 import re
+import json
 import logging
 import random
-from datetime import datetime
+from time import monotonic
 from collections import OrderedDict
-from urllib.parse import urljoin
-from functools import partial
+from urllib.parse import urljoin, urlparse
+from functools import partial, lru_cache
+from types import MappingProxyType
+from weakref import WeakKeyDictionary
+from http.client import HTTPException
 
 from urllib3.poolmanager import ProxyManager
-from urllib3.exceptions import IncompleteRead
+from urllib3.exceptions import IncompleteRead, HTTPError
 from requests.cookies import RequestsCookieJar
 from requests.adapters import HTTPAdapter
 from requests.sessions import Session
+from requests.exceptions import RequestException
 from requests.utils import select_proxy, urldefragauth
-from gevent import sleep, GreenletExit
+from gevent import sleep
+from gevent.lock import Semaphore
 
 from .exceptions import InsufficientProxies, ProxyMaxRetriesExceeded
 from .utils import repr_response, get_random_user_agent
@@ -21,7 +27,27 @@ from .utils import repr_response, get_random_user_agent
 logger = logging.getLogger(__name__)
 
 PROXY_MAX_RETRIES_DEFAULT = 3
+# Backoff between proxy retries, enabled with proxy_retry_base > 0
+PROXY_RETRY_CAP_DEFAULT = 30
+PROXY_RETRY_JITTER_DEFAULT = 0.5
 TIMEOUT_DEFAULT = 10
+# Flags which may be applied to part of pattern, see RegexpMountSession
+REGEXP_SCOPED_FLAGS = ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'),
+                       (re.VERBOSE, 'x'), (re.ASCII, 'a'))
+# Pattern with backreference, conditional or global inline flags, can't be joined
+# with others (named groups are checked with pattern.groupindex)
+REGEXP_UNJOINABLE = re.compile(r'\\[1-9]|\(\?(?:\(|[aiLmsux]+\))')
+# Pattern without special characters, which may be matched as url prefix
+REGEXP_LITERAL_PREFIX = re.compile(r'\^?((?:[\w:/@%=&,;~-]|\\[.?+*$^|()\[\]{}/-])+)$')
+PROXY_AFFINITY_MAX_SIZE = 512
+# Session attributes which may be passed to ConfigurableSession.__init__
+CONFIGURABLE_SESSION_ATTRS = frozenset((
+    'headers', 'auth', 'proxies', 'hooks', 'params', 'stream', 'verify', 'cert',
+    'max_redirects', 'trust_env', 'cookies', 'timeout', 'allow_redirects',
+))
+
+# Exceptions considered as proxy failure, others are reraised without retry
+PROXY_ERRORS = (RequestException, HTTPError, HTTPException, OSError)
 
 
 class ForgetfulCookieJar(RequestsCookieJar):
@@ -30,6 +56,10 @@ class ForgetfulCookieJar(RequestsCookieJar):
         return
 
 
+# Jar is always empty (all setters are going through set_cookie), so it's shared
+_FORGETFUL_COOKIE_JAR = ForgetfulCookieJar()
+
+
 class SharedProxyManagerHTTPAdapter(HTTPAdapter):
     """
     ProxyManager holds connection pool, so if we're using different sessions,
@@ -45,6 +75,10 @@ class ConfigurableSession(Session):
     Helper class that allows to pass some parameters to __init__
     instead of setting them later and extends with common functionality.
     """
+    # Defaults for request kwargs, None means not set
+    timeout = None
+    allow_redirects = None
+
     def __init__(self, request_wait=0, retry_response=None,
                  retry_exception=None, retry_count=0, retry_wait=0,
                  forgetful_cookies=False, enforce_content_length=False,
@@ -68,15 +102,15 @@ class ConfigurableSession(Session):
             assert all(self.adapters.values())
 
         for k, v in kwargs.items():
-            if k in ('headers', 'auth', 'proxies', 'hooks', 'params', 'stream',
-                     'verify', 'cert', 'max_redirects', 'trust_env', 'cookies',
-                     'timeout', 'allow_redirects'):
+            if k in CONFIGURABLE_SESSION_ATTRS:
                 setattr(self, k, v)
             else:
                 raise TypeError('Unknown keyword argument: {}'.format(k))
 
         self.request_wait = request_wait
         self.request_at = None
+        # serializes request_wait between greenlets sharing this session
+        self._request_wait_lock = Semaphore()
         self.retry_response = retry_response
         self.retry_exception = retry_exception
         self.retry_count = retry_count
@@ -84,49 +118,60 @@ class ConfigurableSession(Session):
 
         if forgetful_cookies:
             assert 'cookies' not in kwargs
-            self.cookies = ForgetfulCookieJar()
+            self.cookies = _FORGETFUL_COOKIE_JAR
 
         self.enforce_content_length = enforce_content_length
 
         if random_user_agent:
-            if isinstance(random_user_agent, (list, tuple, set)):
+            if isinstance(random_user_agent, (list, tuple)):
                 random_user_agent = random.choice(random_user_agent)
+            elif isinstance(random_user_agent, set):
+                # random.choice requires sequence
+                random_user_agent = random.choice(tuple(random_user_agent))
             else:
                 random_user_agent = get_random_user_agent()
             self.headers['User-Agent'] = random_user_agent
 
     def request(self, *args, **kwargs):
-        kwargs.setdefault('timeout', getattr(self, 'timeout', None))
-        if hasattr(self, 'allow_redirects'):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.allow_redirects is not None:
             kwargs['allow_redirects'] = self.allow_redirects
 
         request_wait = kwargs.pop('request_wait', self.request_wait)
         retry_response = kwargs.pop('retry_response', self.retry_response)
         retry_exception = kwargs.pop('retry_exception', self.retry_exception)
-        retry_count = kwargs.get('retry_count', self.retry_count)
-        retry_wait = retry_default_wait = kwargs.get('retry_wait', self.retry_wait)
+        retry_count = kwargs.pop('retry_count', self.retry_count)
+        retry_wait = retry_default_wait = kwargs.pop('retry_wait', self.retry_wait)
+
+        if not (request_wait or retry_count or retry_response or retry_exception or
+                self.enforce_content_length):
+            # fast path, nothing to wait, validate or retry
+            self.request_at = monotonic()
+            return super().request(*args, **kwargs)
 
         for retry in range(retry_count + 1):
             wait = retry and (retry_wait if type(retry_wait) in (int, float)
                               else retry_default_wait) or request_wait
-            while wait and self.request_at:
-                # checking continuous for simultaneous use
-                delta = (datetime.utcnow() - self.request_at).total_seconds()
-                if 0 < delta < wait:
-                    sleep(wait - delta)
-                else:
-                    break
-            self.request_at = datetime.utcnow()
+            if wait and self.request_at:
+                with self._request_wait_lock:
+                    delta = monotonic() - self.request_at
+                    if 0 < delta < wait:
+                        sleep(wait - delta)
+                    self.request_at = monotonic()
+            else:
+                self.request_at = monotonic()
 
             try:
                 resp = super().request(*args, **kwargs)
-                if self.enforce_content_length and resp.raw.length_remaining not in (0, None):
-                    # NOTE: This param may be set in urllib3.response.HTTPResponse,
-                    # but there is no possibility to pass it to requests.adapters.HTTPAdapter.
-                    # Also we couldn't reproduce success response if Content-Length is greater
-                    # than real content body (requests fails with ReadTimeout error), but
-                    # somehow we manage to get such responses from proxies.
-                    read, remaining = resp.raw._fp_bytes_read, resp.raw.length_remaining
+                # NOTE: This param may be set in urllib3.response.HTTPResponse,
+                # but there is no possibility to pass it to requests.adapters.HTTPAdapter.
+                # Also we couldn't reproduce success response if Content-Length is greater
+                # than real content body (requests fails with ReadTimeout error), but
+                # somehow we manage to get such responses from proxies.
+                # length_remaining is None without Content-Length, 0 if body is complete
+                remaining = self.enforce_content_length and resp.raw.length_remaining
+                if remaining:
+                    read = resp.raw._fp_bytes_read
                     resp.close()
                     raise IncompleteRead(read, remaining)
             except Exception as exc:
@@ -141,6 +186,12 @@ class ConfigurableSession(Session):
         return resp
 
 
+@lru_cache(maxsize=64)
+def _base_url_dir(base_url):
+    # base url without last path segment, query and fragment, same as urljoin does
+    return urljoin(base_url, '.')
+
+
 class BaseUrlSession(Session):
     base_url = None
 
@@ -151,7 +202,13 @@ class BaseUrlSession(Session):
 
     def request(self, method, url, *args, **kwargs):
         if self.base_url:
-            url = urljoin(self.base_url, url)
+            # fast path for plain relative urls like "api/item?id=1", no scheme
+            # (colon before first slash), no dot and no empty segments to resolve
+            if (url[:1].isalnum() and ':' not in url.partition('/')[0] and
+                    '/.' not in url and '//' not in url):
+                url = _base_url_dir(self.base_url) + url
+            else:
+                url = urljoin(self.base_url, url)
         return super().request(method, url, *args, **kwargs)
 
 
@@ -161,25 +218,83 @@ class RegexpMountSession(Session):
     Useful if you want to mount custom HTTPAdapter (for example ProxyListHTTPAdapter)
     only to specific urls, but you haven't proper url hierarchy.
     """
-    def __init__(self, regexp_adapters={}, **kwargs):
-        self.regexp_adapters = OrderedDict()
-        for pattern, adapter in regexp_adapters.items():
-            self.regexp_mount(pattern, adapter)
+    def __init__(self, regexp_adapters=None, **kwargs):
+        # patterns are matched in insertion order (dict is ordered since python 3.7),
+        # read only, as lookup index is rebuilt on regexp_mount and regexp_unmount
+        self._regexp_adapters = {}
+        self.regexp_adapters = MappingProxyType(self._regexp_adapters)
+        for pattern, adapter in (regexp_adapters or {}).items():
+            if not isinstance(pattern, re.Pattern):
+                pattern = re.compile(pattern)
+            self._regexp_adapters[pattern] = adapter
+        # (prefixes, joined pattern, groups, other patterns),
+        # updated inplace to be shared, see SharedMountSession
+        self._regexp_adapters_index = [(), None, {}, ()]
+        # compiling joined pattern once, not on each mount
+        self._regexp_adapters_update()
 
         super().__init__(**kwargs)
 
     def regexp_mount(self, pattern, adapter):
-        if not isinstance(pattern, re._pattern_type):
-            # compat for python < 3.6
-            # see https://stackoverflow.com/a/34178375/450103
-            # and https://stackoverflow.com/a/30943547/450103
+        if not isinstance(pattern, re.Pattern):
+            pattern = re.compile(pattern)
+        self._regexp_adapters[pattern] = adapter
+        self._regexp_adapters_update()
+
+    def regexp_unmount(self, pattern):
+        if not isinstance(pattern, re.Pattern):
             pattern = re.compile(pattern)
-        self.regexp_adapters[pattern] = adapter
+        adapter = self._regexp_adapters.pop(pattern)
+        self._regexp_adapters_update()
+        return adapter
+
+    def _regexp_adapters_update(self):
+        # literal patterns are matched with str.startswith, others are joined
+        # to one alternation, so url is matched in one pass,
+        # outer group number of matched alternative maps to pattern (index, adapter),
+        # flags are kept as scoped inline flags.
+        # Patterns which can't be joined are matched one by one
+        prefixes, joined, groups, patterns, group = [], [], {}, [], 1
+        for i, (pattern, adapter) in enumerate(self.regexp_adapters.items()):
+            literal = (not pattern.flags & re.IGNORECASE and
+                       REGEXP_LITERAL_PREFIX.match(pattern.pattern))
+            if literal:
+                prefixes.append((re.sub(r'\\(.)', r'\1', literal.group(1)), (i, adapter)))
+            elif pattern.groupindex or REGEXP_UNJOINABLE.search(pattern.pattern):
+                patterns.append((pattern, (i, adapter)))
+            else:
+                # verbose pattern may end with comment, so newline is appended
+                joined.append('((?{}:{}{}))'.format(
+                    ''.join(f for flag, f in REGEXP_SCOPED_FLAGS if pattern.flags & flag),
+                    pattern.pattern, '\n' if pattern.flags & re.VERBOSE else ''))
+                groups[group] = (i, adapter)
+                group += 1 + pattern.groups
+        self._regexp_adapters_index[:] = (
+            tuple(prefixes), joined and re.compile('|'.join(joined)) or None, groups,
+            tuple(patterns))
 
     def get_adapter(self, url):
-        for pattern, adapter in self.regexp_adapters.items():
-            if re.match(url):
-                return adapter
+        prefixes, regexp, groups, patterns = self._regexp_adapters_index
+        found = None  # (index, adapter) of first mounted pattern matching url
+        for prefix, found_ in prefixes:
+            if url.startswith(prefix):
+                found = found_
+                break
+        if regexp:
+            match = regexp.match(url)
+            if match:
+                # first matched alternative, its outer group is closed last
+                found_ = groups[match.lastindex]
+                if not found or found_[0] < found[0]:
+                    found = found_
+        for pattern, found_ in patterns:
+            if found and found_[0] > found[0]:
+                break
+            if pattern.match(url):
+                found = found_
+                break
+        if found:
+            return found[1]
         return super().get_adapter(url)
 
 
@@ -197,9 +312,11 @@ class SharedMountSession(Session):
         if hasattr(self, 'regexp_adapters'):
             # compatibility with RegexpMountSession
             if hasattr(self.__class__, '_shared_regexp_adapters'):
-                self.regexp_adapters = self._shared_regexp_adapters
+                (self._regexp_adapters, self.regexp_adapters,
+                 self._regexp_adapters_index) = self._shared_regexp_adapters
             else:
-                self.__class__._shared_regexp_adapters = self.regexp_adapters
+                self.__class__._shared_regexp_adapters = (
+                    self._regexp_adapters, self.regexp_adapters, self._regexp_adapters_index)
 
 
 class SuppressExceptionSession(Session):
@@ -232,13 +349,36 @@ class SuppressExceptionSession(Session):
             raise
 
 
+def proxy_retry_backoff_max(options):
+    # Upper bound of backoff sleeps between retries for proxy_* options,
+    # to be added to deadline of all retries
+    base = options.get('proxy_retry_base', 0)
+    if not base:
+        return 0
+    cap = options.get('proxy_retry_cap', PROXY_RETRY_CAP_DEFAULT)
+    jitter = options.get('proxy_retry_jitter', PROXY_RETRY_JITTER_DEFAULT)
+    max_retries = options.get('proxy_max_retries', PROXY_MAX_RETRIES_DEFAULT)
+    return sum(min(cap, base * (1 << retry)) * (1 + jitter) for retry in range(max_retries - 1))
+
+
+def _pop_proxy_kwargs(kwargs):
+    # keys are collected first, kwargs can't be changed while iterating
+    return {k: kwargs.pop(k) for k in [k for k in kwargs if k.startswith('proxy_')]}
+
+
 class ProxyListMixin:
     def __init__(self, proxylist, request_method_name, allow_no_proxy=False, **kwargs):
         self.proxylist = proxylist
         self.allow_no_proxy = allow_no_proxy
-        self.proxy_kwargs = {k: kwargs.pop(k) for k in tuple(kwargs.keys())
-                             if k.startswith('proxy_')}
+        self.proxy_kwargs = _pop_proxy_kwargs(kwargs)
+        # wrap session default response matches once, not on every request
+        for key in ('proxy_success_response', 'proxy_fail_response', 'proxy_rest_response'):
+            if key in self.proxy_kwargs:
+                self.proxy_kwargs[key] = self._response_match(self.proxy_kwargs[key])
         self._persist_addr = None
+        self._default_strategy = proxylist._get_fastest
+        # LRU of target netloc -> last succeeded proxy addr, see proxy_affinity
+        self._affinity = OrderedDict()
 
         request = getattr(self, request_method_name)
         setattr(self, request_method_name, partial(self._proxylist_request, request))
@@ -246,80 +386,119 @@ class ProxyListMixin:
         super().__init__(**kwargs)
 
     @staticmethod
-    def _pop_response_match(key, params):
+    def _response_match(match):
         # TODO: allow superproxy to pass serveral headers for this mechanics
-        try:
-            match = params.pop(key)
-        except KeyError:
-            return None
         if isinstance(match, (tuple, list)):
             # assert all(callable(v) for v in match)
             return lambda resp: any(cb(resp) for cb in match)
         # assert callable(match)
         return match
 
+    @staticmethod
+    def _get_netloc(args, kwargs):
+        # Session.request(method, url, ...) or HTTPAdapter.send(request, ...)
+        if args and hasattr(args[0], 'url'):
+            return urlparse(args[0].url).netloc
+        return urlparse(args[1] if len(args) > 1 else kwargs['url']).netloc
+
+    def _set_affinity(self, netloc, addr):
+        self._affinity[netloc] = addr
+        self._affinity.move_to_end(netloc)
+        if len(self._affinity) > PROXY_AFFINITY_MAX_SIZE:
+            self._affinity.popitem(last=False)
+
+    def _unset_affinity(self, netloc, addr):
+        # concurrent request may already succeed with another proxy for this netloc
+        if self._affinity.get(netloc) == addr:
+            del self._affinity[netloc]
+
     def _proxylist_request(self, request, *args, **kwargs):
-        if kwargs.get('proxies'):
+        # sanity check, stripped with python -O like assert
+        if __debug__ and kwargs.get('proxies'):
             raise ValueError('proxies argument is not empty, '
                              'but should be populated from proxylist')
 
-        for k, v in self.proxy_kwargs.items():
-            kwargs.setdefault(k, v)
-
-        strategy = kwargs.pop('proxy_strategy', self.proxylist._get_fastest)
-        max_retries = kwargs.pop('proxy_max_retries', PROXY_MAX_RETRIES_DEFAULT)
-        success_response = self._pop_response_match('proxy_success_response', kwargs)
-        success_timeout = kwargs.pop('proxy_success_timeout', None)
-        fail_response = self._pop_response_match('proxy_fail_response', kwargs)
-        fail_timeout = kwargs.pop('proxy_fail_timeout', None)
-        rest_response = self._pop_response_match('proxy_rest_response', kwargs)
-        rest_timeout = kwargs.pop('proxy_rest_timeout', None)
-        request_ident = kwargs.pop('proxy_request_ident', None)
-        debug = kwargs.pop('proxy_debug', False)
+        # Split proxy_* options from request kwargs in one pass, session defaults first
+        options = dict(self.proxy_kwargs)
+        options.update(_pop_proxy_kwargs(kwargs))
+
+        strategy = options.pop('proxy_strategy', self._default_strategy)
+        max_retries = options.pop('proxy_max_retries', PROXY_MAX_RETRIES_DEFAULT)
+        success_response = self._response_match(options.pop('proxy_success_response', None))
+        success_timeout = options.pop('proxy_success_timeout', None)
+        fail_response = self._response_match(options.pop('proxy_fail_response', None))
+        fail_timeout = options.pop('proxy_fail_timeout', None)
+        rest_response = self._response_match(options.pop('proxy_rest_response', None))
+        rest_timeout = options.pop('proxy_rest_timeout', None)
+        request_ident = options.pop('proxy_request_ident', None)
+        debug = options.pop('proxy_debug', False)
         if rest_response and not rest_timeout:
             raise ValueError('rest_response must be used with rest_timeout > 0')
+        retry_base = options.pop('proxy_retry_base', 0)
+        retry_cap = options.pop('proxy_retry_cap', PROXY_RETRY_CAP_DEFAULT)
+        retry_jitter = options.pop('proxy_retry_jitter', PROXY_RETRY_JITTER_DEFAULT)
 
         # NOTE: exclude precedes persist, so persist is ignored if it's in exclude
-        persist = kwargs.pop('proxy_persist', False)
+        persist = options.pop('proxy_persist', False)
         persist_addr = self._persist_addr if persist is True else persist
-        exclude = kwargs.pop('proxy_exclude', [])
-
-        proxy_kwargs = {k[6:]: kwargs.pop(k) for k in tuple(kwargs.keys())
-                        if k.startswith('proxy_')}
+        # copy to set, so caller sequence is not populated with failed proxies
+        exclude = set(options.pop('proxy_exclude', ()))
+        # Reuse last succeeded proxy for same target domain (keep-alive connections
+        # between proxy and target), persist precedes affinity
+        affinity = options.pop('proxy_affinity', False)
+        netloc = affinity and self._get_netloc(args, kwargs)
+        if netloc and not persist_addr:
+            persist_addr = self._affinity.get(netloc)
+
+        # Other options are passed to proxylist.get
+        proxy_kwargs = {k[6:]: v for k, v in options.items()}
         allow_no_proxy = kwargs.pop('allow_no_proxy', self.allow_no_proxy)
         if allow_no_proxy:
             proxy_kwargs.setdefault('wait', False)
 
+        proxylist = self.proxylist  # local for retry loop
         fail_count, rest_count = 0, 0
-        for _ in range(max_retries):
+        for retry in range(max_retries):
+            if retry and retry_base:
+                # truncated exponential backoff with jitter after failed or rest proxy
+                sleep(min(retry_cap, retry_base * (1 << (retry - 1))) *
+                      (1 + random.random() * retry_jitter))
 
             try:
-                proxy = self.proxylist.get(strategy, exclude=exclude, persist=persist_addr,
-                                           request_ident=request_ident, **proxy_kwargs)
+                proxy = proxylist.get(strategy, exclude=exclude, persist=persist_addr,
+                                      request_ident=request_ident, **proxy_kwargs)
             except InsufficientProxies as exc:
                 if allow_no_proxy:
-                    proxy = None
+                    proxy = addr = None
                     kwargs['proxies'] = None
                 else:
                     raise
             else:
-                kwargs['proxies'] = {'http': proxy.url, 'https': proxy.url}
+                addr, url = proxy.addr, proxy.url
+                kwargs['proxies'] = {'http': url, 'https': url}
 
             exc_ = None  # workaround for "smart" python3 variable clearing
             try:
                 resp = request(*args, **kwargs)
-            except BaseException as exc:
-                if not proxy or isinstance(exc, GreenletExit):
+            except PROXY_ERRORS as exc:
+                if not proxy:
                     raise
 
                 fail_count += 1
-                self.proxylist.fail(proxy, timeout=fail_timeout, exc=exc,
-                                    request_ident=request_ident, debug=debug)
+                proxylist.fail(proxy, timeout=fail_timeout, exc=exc,
+                               request_ident=request_ident, debug=debug)
                 if persist is True:
                     self._persist_addr = None
-                exclude.append(proxy.addr)
-                logger.debug('Failed proxy %s: %r', proxy.addr, exc)
+                if netloc:
+                    self._unset_affinity(netloc, addr)
+                exclude.add(addr)
+                logger.debug('Failed proxy %s: %r', addr, exc)
                 exc_ = exc  # workaround for "smart" python3 variable clearing
+            except BaseException:
+                # Not proxy related error, timeout or greenlet kill
+                if proxy:
+                    proxylist.release(proxy)
+                raise
             else:
                 if not proxy:
                     resp._proxy = None
@@ -329,29 +508,35 @@ class ProxyListMixin:
                     return resp
                 if rest_response and rest_response(resp):
                     rest_count += 1
-                    self.proxylist.rest(proxy, timeout=rest_timeout, resp=resp,
-                                        request_ident=request_ident, debug=debug)
+                    proxylist.rest(proxy, timeout=rest_timeout, resp=resp,
+                                   request_ident=request_ident, debug=debug)
                     if persist is True:
                         self._persist_addr = None
-                    exclude.append(proxy.addr)
+                    if netloc:
+                        self._unset_affinity(netloc, addr)
+                    exclude.add(addr)
 
                 elif ((not fail_response or not fail_response(resp)) and
                       (not success_response or success_response(resp))):
-                    self.proxylist.success(proxy, timeout=success_timeout, resp=resp,
-                                           request_ident=request_ident)
+                    proxylist.success(proxy, timeout=success_timeout, resp=resp,
+                                      request_ident=request_ident)
                     if persist is True:
-                        self._persist_addr = proxy.addr
+                        self._persist_addr = addr
+                    if netloc:
+                        self._set_affinity(netloc, addr)
                     resp._proxy = proxy
                     resp._rest_count = rest_count
                     resp._fail_count = fail_count
                     return resp
                 else:
                     fail_count += 1
-                    self.proxylist.fail(proxy, timeout=fail_timeout, resp=resp,
-                                        request_ident=request_ident)
+                    proxylist.fail(proxy, timeout=fail_timeout, resp=resp,
+                                   request_ident=request_ident)
                     if persist is True:
                         self._persist_addr = None
-                    exclude.append(proxy.addr)
+                    if netloc:
+                        self._unset_affinity(netloc, addr)
+                    exclude.add(addr)
         reason_repr = exc_ and repr(exc_) or repr_response(resp)
         raise ProxyMaxRetriesExceeded('Max retries exceeded: {} {}'
                                       .format(max_retries, reason_repr),
@@ -376,17 +561,22 @@ class ProxyListSession(ProxyListMixin, ConfigurableSession):
     Session that is using proxies from ProxyList.
     """
     # Never work with proxies without timeout!
-    # NOTE: this timeout applies to each request,
-    # so total timeout would be proxy_max_retries * timeout
+    # NOTE: this timeout applies to each request, so total timeout would be
+    # proxy_max_retries * timeout + backoff sleeps, see proxy_retry_backoff_max
     timeout = TIMEOUT_DEFAULT
+    # One adapter per proxylist for all sessions, so direct connection pools are shared too
+    _proxylist_adapters = WeakKeyDictionary()
 
     def __init__(self, proxylist, **kwargs):
-        # https://github.com/requests/requests/blob/v2.18.4/requests/adapters.py#L110
-        adapter_kwargs = {
-            'pool_connections': proxylist.max_simultaneous,
-            'pool_maxsize': proxylist.max_simultaneous,
-        }
-        adapter = SharedProxyManagerHTTPAdapter(proxylist.proxy_pool_manager, **adapter_kwargs)
+        adapter = self._proxylist_adapters.get(proxylist)
+        if not adapter:
+            # https://github.com/requests/requests/blob/v2.18.4/requests/adapters.py#L110
+            adapter_kwargs = {
+                'pool_connections': proxylist.max_simultaneous,
+                'pool_maxsize': proxylist.max_simultaneous,
+            }
+            adapter = self._proxylist_adapters[proxylist] = SharedProxyManagerHTTPAdapter(
+                proxylist.proxy_pool_manager, **adapter_kwargs)
         kwargs['mount'] = {'http://': adapter, 'https://': adapter}
         super().__init__(proxylist, 'request', **kwargs)
 
@@ -417,11 +607,10 @@ class SuperProxySession(ConfigurableSession):
                    in [InsufficientProxies, ProxyMaxRetriesExceeded]}
 
     def __init__(self, superproxy_url, proxy_persist=False, adapter={}, **kwargs):
-        from .superproxy import SUPERPROXY_REQUEST_HEADERS  # avoid cycle imports
-        self.SUPERPROXY_REQUEST_HEADERS = SUPERPROXY_REQUEST_HEADERS
+        from .superproxy import SUPERPROXY_SESSION_HEADERS  # avoid cycle imports
+        self.SUPERPROXY_SESSION_HEADERS = SUPERPROXY_SESSION_HEADERS
 
-        self.proxy_kwargs = {k: kwargs.pop(k) for k in tuple(kwargs)
-                             if k.startswith('proxy_')}
+        self.proxy_kwargs = _pop_proxy_kwargs(kwargs)
         self._persist_addr = proxy_persist
         kwargs['adapter'] = (PlainHTTPSProxyManagerHTTPAdapter(**adapter)
                              if isinstance(adapter, dict) else adapter)
@@ -434,28 +623,30 @@ class SuperProxySession(ConfigurableSession):
         # can't easily pass proxy_kwargs there
         kwargs['allow_redirects'] = False
 
-        for k, v in self.proxy_kwargs.items():
-            kwargs.setdefault(k, v)
+        proxy_kwargs = dict(self.proxy_kwargs)
         if self._persist_addr and self._persist_addr is not True:
-            kwargs.setdefault('proxy_persist', self._persist_addr)
+            proxy_kwargs['proxy_persist'] = self._persist_addr
+        proxy_kwargs.update(_pop_proxy_kwargs(kwargs))
 
-        proxy_kwargs = {k: kwargs.pop(k) for k in tuple(kwargs)
-                        if k.startswith('proxy_')}
-
-        headers = headers or {}
+        # copy to not populate caller headers with superproxy ones
+        headers = dict(headers) if headers else {}
         for key, value in proxy_kwargs.items():
-            if key in ['proxy_timeout', 'proxy_allow_no_proxy']:
-                key = key[6:]
-            headers['X-Superproxy-' + key.replace('_', '-').title()] = \
-                self.SUPERPROXY_REQUEST_HEADERS[key][1](value)
+            header, encode = self.SUPERPROXY_SESSION_HEADERS[key]
+            headers[header] = encode(value)
 
         resp = super().request(method, url, headers=headers, **kwargs)
         error_cls_name = resp.headers.get('X-Superproxy-Error')
         if error_cls_name:
+            # Decoding bytes directly, skipping requests encoding detection
+            try:
+                error_args = json.loads(resp.content)
+            except ValueError:
+                # Not an exception, but superproxy connection error in plain text
+                raise Exception(error_cls_name, resp.text)
             if error_cls_name in self.reraise_map:
                 # First arg is the name of exception class
-                raise self.reraise_map[error_cls_name](*resp.json()[1:])
-            raise Exception(*resp.json())
+                raise self.reraise_map[error_cls_name](*error_args[1:])
+            raise Exception(*error_args)
 
         if self._persist_addr:
             self._persist_addr = resp.headers.get('X-Superproxy-Addr') or None
@@ -483,8 +674,11 @@ class PlainHTTPSProxyManagerHTTPAdapter(HTTPAdapter):
     HTTP adapter that is NOT USING "CONNECT" for https urls.
     """
     def proxy_manager_for(self, proxy, **proxy_kwargs):
-        if (proxy not in self.proxy_manager and
-           not proxy.lower().startswith('socks')):
+        # managers are cached by proxy url, so usually one dict lookup is enough
+        manager = self.proxy_manager.get(proxy)
+        if manager:
+            return manager
+        if proxy[:5].lower() != 'socks':
             manager = self.proxy_manager[proxy] = PlainHTTPSProxyManager(
                 proxy,
                 proxy_headers=self.proxy_headers(proxy),
@@ -496,8 +690,9 @@ class PlainHTTPSProxyManagerHTTPAdapter(HTTPAdapter):
         return super().proxy_manager_for(proxy, **proxy_kwargs)
 
     def request_url(self, request, proxies):
-        proxy = select_proxy(request.url, proxies)
-        if (not proxy.lower().startswith('socks') and
-           request.url.lower().startswith('https://')):
-            return urldefragauth(request.url)
+        url = request.url
+        proxy = select_proxy(url, proxies)
+        # lowering only scheme part, not whole url
+        if proxy and proxy[:5].lower() != 'socks' and url[:8].lower() == 'https://':
+            return urldefragauth(url)
         return super().request_url(request, proxies)
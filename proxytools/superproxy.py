@@ -1,9 +1,16 @@
 import logging
+from time import monotonic
 from datetime import datetime, timedelta
+from collections import OrderedDict, defaultdict
 from urllib.parse import parse_qsl
 from itertools import chain
-from base64 import b64decode
+from operator import itemgetter
+from functools import lru_cache
+from heapq import nlargest, nsmallest
+from base64 import b64encode
+from hmac import compare_digest
 import json
+import gzip
 
 from gevent import Timeout
 from requests.status_codes import _codes, codes
@@ -11,13 +18,17 @@ from pytimeparse.timeparse import timeparse
 import netaddr
 
 from .models import PROXY_RESULT_TYPE
-from .requests import PROXY_MAX_RETRIES_DEFAULT, TIMEOUT_DEFAULT
-from .utils import ResponseMatch, import_string
+from .requests import PROXY_MAX_RETRIES_DEFAULT, TIMEOUT_DEFAULT, proxy_retry_backoff_max
+from .utils import ResponseMatch, JSONEncoder, import_string
 
 
 logger = logging.getLogger(__name__)
 
 ALLOWED_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'OPTIONS')
+# Seconds to reuse encoded /status response, as it's polled by frontend
+STATUS_CACHE_TIMEOUT = 0.5
+# Max remote addrs to remember allow_addrs check result for
+ADDRS_CACHE_MAX_SIZE = 4096
 
 HOP_BY_HOP_HEADERS = frozenset([
     'connection', 'keep-alive', 'proxy-authenticate',
@@ -25,8 +36,17 @@ HOP_BY_HOP_HEADERS = frozenset([
     'upgrade', 'proxy-connection', 'content-encoding'
 ])
 
+# Same request headers as WSGI environ keys (always upper case), so checked before converting
+HOP_BY_HOP_WSGI_KEYS = frozenset('HTTP_' + h.upper().replace('-', '_')
+                                 for h in HOP_BY_HOP_HEADERS)
+
+# Response headers not passed to superproxy client, content is sent with own length
+HOP_BY_HOP_AND_LENGTH_HEADERS = HOP_BY_HOP_HEADERS | {'content-length'}
+
 STATUS_CODE_TITLES = {code: titles[0].replace('_', ' ').title()
                       for code, titles in _codes.items()}
+# WSGI status lines, like "200 Ok"
+STATUS_LINES = {code: '{} {}'.format(code, title) for code, title in STATUS_CODE_TITLES.items()}
 
 SUPERPROXY_REQUEST_HEADERS = {
     # Keyword arguments for proxylist.request: decode, encode
@@ -37,6 +57,7 @@ SUPERPROXY_REQUEST_HEADERS = {
     'proxy_wait': (lambda x: {'f': False, 't': True}.get(x, int(x)),
                    lambda x: str({True: 't', False: 'f'}.get(x, x))),
     'proxy_persist': (str, str),
+    'proxy_affinity': (lambda x: bool(int(x)), lambda x: str(int(x))),
     'proxy_exclude': (lambda x: x.split(','), lambda x: ','.join(x)),
     'proxy_countries': (lambda x: x.split(','), lambda x: ','.join(x)),
     'proxy_countries_exclude': (lambda x: x.split(','), lambda x: ','.join(x)),
@@ -52,10 +73,26 @@ SUPERPROXY_REQUEST_HEADERS = {
                             ResponseMatch._list_to_superproxy_header),
     'proxy_rest_timeout': (int, str),
     'proxy_debug': (lambda x: bool(int(x)), lambda x: str(int(x))),
+    'proxy_retry_base': (float, str),
+    'proxy_retry_cap': (float, str),
+    'proxy_retry_jitter': (float, str),
     # TODO: Add authorization header encoder for SuperproxySession,
     # because it's already implemented in wsgi app
 }
 
+# WSGI environ key: (keyword argument, decode)
+SUPERPROXY_WSGI_KEYS = {
+    'HTTP_X_SUPERPROXY_' + key.upper(): (key, decode)
+    for key, (decode, encode) in SUPERPROXY_REQUEST_HEADERS.items()
+}
+
+# SuperProxySession keyword argument: (header name, encode)
+SUPERPROXY_SESSION_HEADERS = {
+    (key if key.startswith('proxy_') else 'proxy_' + key):
+        ('X-Superproxy-' + key.replace('_', '-').title(), encode)
+    for key, (decode, encode) in SUPERPROXY_REQUEST_HEADERS.items()
+}
+
 
 def is_hop_by_hop(header):
     return header.lower() in HOP_BY_HOP_HEADERS
@@ -68,43 +105,137 @@ def reconstruct_url(environ):
     #     url, arg = url.split('%3B', 1)
     #     url = ';'.join([url, arg.replace('%3D', '=')])
     # Stick query string back in
-    if environ.get('QUERY_STRING'):
-        return url + '?' + environ['QUERY_STRING']
-    return url
+    qs = environ.get('QUERY_STRING')
+    return qs and url + '?' + qs or url
+
+
+@lru_cache(maxsize=256)
+def _wsgi_key_to_header(key):
+    # HTTP_USER_AGENT -> User-Agent, clients send mostly the same headers
+    return key[5:].replace('_', '-').title()
+
+
+@lru_cache(maxsize=32)
+def _accepts_gzip(accept_encoding):
+    # "gzip;q=0" or "*;q=0" refuses coding, explicit coding precedes "*"
+    qvalues = {}
+    for coding in accept_encoding.lower().split(','):
+        coding, _, params = coding.partition(';')
+        qvalue = 1
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0
+        qvalues[coding.strip()] = qvalue
+    return qvalues.get('gzip', qvalues.get('x-gzip', qvalues.get('*', 0))) > 0
+
+
+@lru_cache(maxsize=128)
+def _parse_qs_cached(qs):
+    return dict(parse_qsl(qs))
+
+
+def _parse_qs(environ):
+    # Admin endpoints are polled mostly with same (or without) query string,
+    # NOTE: returned dict is shared, don't modify it
+    qs = environ.get('QUERY_STRING')
+    return qs and _parse_qs_cached(qs) or {}
+
 
+def _parse_qs_list(qs, key, default):
+    # NOTE: ''.split(',') is [''], so checking for empty value first
+    return frozenset(qs[key].split(',') if qs.get(key) else default)
 
-def _match_proxy_search_token(p, token):
-    return (
-        token in p.addr or
-        (p.country and token in p.country) or
-        any(token in source for source in p.fetch_sources) or
-        any(token in type.name for type in p.types)
-    )
+
+def _parse_qs_search(qs):
+    # "a+b c" means (a and b) or c
+    return tuple(set(token for token in token_group.split('+') if token)
+                 for token_group in qs.get('search', '').split() if token_group)
+
+
+def _parse_qs_page(qs):
+    # Returns (start, per_page), start is None if all items requested
+    per_page = int(qs.get('per_page', 50))
+    return ((int(qs['page']) - 1) * per_page) if 'page' in qs else None, per_page
+
+
+# /proxies sort param -> sort key, with fallback for None values
+PROXY_SORT_KEYS = {
+    'speed': lambda p: p.speed or -1,
+    'used_at': lambda p: p.used_at or datetime.min,
+}
+
+
+def _sort_page(items, key, reverse, start, per_page):
+    # Partial heap sort if page requested, same result as sorted()[start:start + per_page]
+    if start is None:
+        return sorted(items, key=key, reverse=reverse)
+    return (nlargest if reverse else nsmallest)(start + per_page, items, key=key)[start:]
+
+
+def _read_body(environ):
+    # Returns None if request has no body
+    content_length = environ.get('CONTENT_LENGTH')
+    if content_length and content_length.isdigit():
+        return environ['wsgi.input'].read(int(content_length))
+
+
+def _proxy_search_text(p):
+    # Searchable fields joined once per proxy, so each token is one substring check,
+    # tokens are splitted by whitespace, so they can't match across fields
+    return '\n'.join(chain((p.addr, p.country or ''), p.fetch_sources,
+                           (type.name for type in p.types)))
 
 
 def _iter_proxies_by_status(proxylist, status):
     now = datetime.utcnow()
-    iterable = []
-    if 'active' in status or 'rest' in status:
-        iterable = chain(iterable, proxylist.active_proxies.values())
-    if 'blacklist' in status:
-        iterable = chain(iterable, proxylist.blacklist_proxies.values())
-    for p in iterable:
-        if p.blacklist:
-            if 'blacklist' not in status:
-                continue
-        elif p.rest_till and p.rest_till > now:
-            if 'rest' not in status:
-                continue
-        elif 'active' not in status:
-            continue
-        yield p
+    active, rest, blacklist = 'active' in status, 'rest' in status, 'blacklist' in status
+    if active or rest:
+        for p in proxylist.active_proxies.values():
+            if p.blacklist:
+                if blacklist:
+                    yield p
+            elif p.rest_till and p.rest_till > now:
+                if rest:
+                    yield p
+            elif active:
+                yield p
+    if blacklist:
+        # ProxyList.blacklist sets proxy.blacklist, no need to check
+        yield from proxylist.blacklist_proxies.values()
+
+
+class CachedAddrs:
+    """
+    Wrapper for netaddr.IPGlob with LRU cache of containment checks,
+    as it parses addr and walks ranges on each check in pure python.
+    """
+    def __init__(self, addrs, max_size=ADDRS_CACHE_MAX_SIZE):
+        self.addrs = addrs
+        self.max_size = max_size
+        self._cache = OrderedDict()
+
+    def __contains__(self, addr):
+        try:
+            self._cache.move_to_end(addr)
+            return self._cache[addr]
+        except KeyError:
+            rv = self._cache[addr] = addr in self.addrs
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+            return rv
+
+    def __repr__(self):
+        return repr(self.addrs)
 
 
 class WSGISuperProxy:
     def __init__(self, proxylist, proxy_allow_addrs=None, admin_allow_addrs=None,
                  proxy_credentials=None, admin_credentials=None,
-                 session_cls='proxytools.requests.ProxyListSession',
+                 session_cls='proxytools.requests.ProxyListSession', json_encoder=None,
                  **session_kwargs):
 
         if isinstance(session_cls, str):
@@ -114,14 +245,28 @@ class WSGISuperProxy:
 
         self.proxylist = proxylist
         self.started_at = datetime.utcnow()
-
-        self.proxy_allow_addrs = proxy_allow_addrs and netaddr.IPGlob(proxy_allow_addrs)
-        self.admin_allow_addrs = admin_allow_addrs and netaddr.IPGlob(admin_allow_addrs)
+        self._status_cache = (0, None)  # (monotonic time, encoded response)
+        # proxylist encoder by default, frontend don't need pretty output, so
+        # {'indent': None, 'separators': [',', ':']} may be passed for stdlib C encoder
+        if isinstance(json_encoder, dict):
+            json_encoder = JSONEncoder(**json_encoder)
+        self.json_encoder = json_encoder or proxylist.json_encoder
+
+        self.proxy_allow_addrs = (proxy_allow_addrs and
+                                  CachedAddrs(netaddr.IPGlob(proxy_allow_addrs)))
+        self.admin_allow_addrs = (admin_allow_addrs and
+                                  CachedAddrs(netaddr.IPGlob(admin_allow_addrs)))
         self.proxy_credentials = proxy_credentials
         self.admin_credentials = admin_credentials
+        # Basic auth tokens precomputed, so header is not decoded on each request
+        self._proxy_auth_tokens = self._auth_tokens(proxy_credentials)
+        self._admin_auth_tokens = self._auth_tokens(admin_credentials)
 
         assert __file__.endswith('.py')
-        self.frontend_html = open( __file__[:-3] + '.html').read()
+        # bytes, so it's not encoded on each response
+        with open(__file__[:-3] + '.html', 'rb') as fh:
+            self.frontend_html = fh.read()
+        self.frontend_html_gzip = gzip.compress(self.frontend_html)
 
         self.redirects = {
             '/': '/superproxy/',
@@ -159,13 +304,13 @@ class WSGISuperProxy:
         if not path.startswith('/'):
             # Proxy request
             error = (self.ensure_remote_addr(environ, start_resp, self.proxy_allow_addrs) or
-                     self.ensure_authorization(environ, start_resp, self.proxy_credentials,
-                                               'X-SUPERPROXY-AUTHORIZATION'))
+                     self.ensure_authorization(environ, start_resp, self._proxy_auth_tokens,
+                                               'X_SUPERPROXY_AUTHORIZATION'))
             return error or self.proxy(environ, start_resp)
 
         # Routing locally otherwise
         error = (self.ensure_remote_addr(environ, start_resp, self.admin_allow_addrs) or
-                 self.ensure_authorization(environ, start_resp, self.admin_credentials,
+                 self.ensure_authorization(environ, start_resp, self._admin_auth_tokens,
                                            'AUTHORIZATION'))
         if error:
             return error
@@ -188,16 +333,24 @@ class WSGISuperProxy:
                 headers=[('X-Superproxy-Error', 'Superproxy connection forbidden')]
             )
 
-    def ensure_authorization(self, environ, start_resp, credentials, header):
-        if credentials:
+    @staticmethod
+    def _auth_tokens(credentials):
+        return tuple(
+            b64encode('{}:{}'.format(username, password).encode('utf8'))
+            for username, password in (credentials or {}).items()
+        )
+
+    def ensure_authorization(self, environ, start_resp, auth_tokens, header):
+        if auth_tokens:
             auth_header = environ.get('HTTP_' + header)
             if not auth_header:
                 return self.unauthorized(environ, start_resp)
             auth = auth_header.split(' ')
-            if auth[0] != 'Basic' or not auth[1]:
+            if auth[0] != 'Basic' or len(auth) < 2 or not auth[1]:
                 return self.unauthorized(environ, start_resp)
-            username, password = b64decode(auth[1]).decode('utf8').split(':', 1)
-            if not credentials.get(username) == password:
+            # Checking all tokens without shortcut to not leak timing
+            token = auth[1].encode('utf8')
+            if not sum(compare_digest(token, t) for t in auth_tokens):
                 return self.unauthorized(environ, start_resp)
 
     def unauthorized(self, environ, start_resp):
@@ -210,13 +363,22 @@ class WSGISuperProxy:
 
     def frontend(self, environ, start_resp):
         auth = environ.get('HTTP_AUTHORIZATION', '')  # Hack to pass authorization for ajax
-        frontend_html = open( __file__[:-3] + '.html').read()
-        return self.resp(start_resp, codes.OK, frontend_html, content_type='text/html',
-            headers=[('Set-Cookie', 'Authorization="{}"; Max-Age: -1'.format(auth))],
-        )
+        headers = [('Set-Cookie', 'Authorization="{}"; Max-Age: -1'.format(auth)),
+                   ('Vary', 'Accept-Encoding')]
+        if _accepts_gzip(environ.get('HTTP_ACCEPT_ENCODING', '')):
+            headers.append(('Content-Encoding', 'gzip'))
+            content = self.frontend_html_gzip
+        else:
+            content = self.frontend_html
+        return self.resp(start_resp, codes.OK, content, content_type='text/html',
+                         headers=headers)
 
     def status(self, environ, start_resp):
-        resp = self.proxylist.json_encoder.dumps(self._status())
+        cached_at, resp = self._status_cache
+        now = monotonic()
+        if not resp or now - cached_at > STATUS_CACHE_TIMEOUT:
+            resp = self.json_encoder.dumps(self._status()).encode('utf-8')
+            self._status_cache = (now, resp)
         return self.resp(start_resp, codes.OK, resp, content_type='application/json')
 
     def _status(self):
@@ -250,33 +412,29 @@ class WSGISuperProxy:
         }
 
     def countries(self, environ, start_resp):
-        resp, now = {}, datetime.utcnow()
-        stats = {'active': 0, 'rest': 0, 'blacklist': 0, 'speed': 0}
-        speeds = {}
+        now = datetime.utcnow()
+        resp = defaultdict(lambda: {'active': 0, 'rest': 0, 'blacklist': 0, 'speed': 0})
+        speeds = defaultdict(list)
 
         for p in self.proxylist.active_proxies.values():
-            resp.setdefault(p.country, stats.copy())
+            stats = resp[p.country]
             if p.rest_till and p.rest_till > now:
-                resp[p.country]['rest'] += 1
+                stats['rest'] += 1
             else:
-                resp[p.country]['active'] += 1
+                stats['active'] += 1
             if p.speed:
-                speeds.setdefault(p.country, [])
                 speeds[p.country].append(p.speed)
 
         for p in self.proxylist.blacklist_proxies.values():
-            resp.setdefault(p.country, stats.copy())
             resp[p.country]['blacklist'] += 1
             if p.speed:
-                speeds.setdefault(p.country, [])
                 speeds[p.country].append(p.speed)
 
-        for key, stats in resp.items():
-            if key in speeds:
-                stats['speed'] = sum(speeds[key]) / len(speeds[key])
+        for key, speeds_ in speeds.items():
+            resp[key]['speed'] = sum(speeds_) / len(speeds_)
 
         return self.resp(start_resp, codes.OK,
-            self.proxylist.json_encoder.dumps(resp), content_type='application/json')
+            self.json_encoder.dumps(resp), content_type='application/json')
 
     def mem_top(self, environ, start_resp):
         # memory-leak debug
@@ -288,65 +446,67 @@ class WSGISuperProxy:
             return self.resp(start_resp, codes.OK, str(mem_top()))
 
     def proxies(self, environ, start_resp):
-        qs = dict(parse_qsl(environ.get('QUERY_STRING', '')))
-        status = qs.get('status', '').split(',') or ('rest', 'active', 'blacklist')
-        search = tuple(set(token for token in token_group.split('+') if token)
-                       for token_group in qs.get('search', '').split() if token_group)
+        qs = _parse_qs(environ)
+        status = _parse_qs_list(qs, 'status', ('rest', 'active', 'blacklist'))
+        search = _parse_qs_search(qs)
         sort, sort_desc = qs.get('sort'), False
         if sort and sort.startswith('-'):
             sort, sort_desc = sort[1:], True
-        per_page = int(qs.get('per_page', 50))
-        start = ((int(qs['page']) - 1) * per_page) if 'page' in qs else None
-
-        proxies = []
-        for p in _iter_proxies_by_status(self.proxylist, status):
-            if (not search or any(all(_match_proxy_search_token(p, token)
-                                      for token in token_group)
-                                  for token_group in search)):
-                proxies.append(p)
-
-        if sort and sort == 'speed':
-            proxies.sort(key=lambda p: p.speed or -1, reverse=sort_desc)
-        elif sort and sort == 'used_at':
-            proxies.sort(key=lambda p: p.used_at, reverse=sort_desc)
-
-        resp = self.proxylist.json_encoder.dumps({
-            'proxies': (proxies[start: start + per_page]
-                        if start is not None else proxies),
-            'total': len(proxies),
+        start, per_page = _parse_qs_page(qs)
+
+        proxies = _iter_proxies_by_status(self.proxylist, status)
+        if search:
+            proxies = (p for p, text in ((p, _proxy_search_text(p)) for p in proxies)
+                       if any(all(token in text for token in token_group)
+                              for token_group in search))
+
+        if sort in PROXY_SORT_KEYS:
+            proxies = tuple(proxies)
+            total = len(proxies)
+            page = _sort_page(proxies, PROXY_SORT_KEYS[sort], sort_desc, start, per_page)
+        elif start is not None:
+            # Not keeping matched proxies out of page, only counting them
+            page, total = [], 0
+            for total, p in enumerate(proxies, 1):
+                if start < total <= start + per_page:
+                    page.append(p)
+        else:
+            page = tuple(proxies)
+            total = len(page)
+
+        resp = self.json_encoder.dumps({
+            'proxies': page,
+            'total': total,
         })
         return self.resp(start_resp, codes.OK, resp, content_type='application/json')
 
     def waiting(self, environ, start_resp):
-        resp = self.proxylist.json_encoder.dumps(self.proxylist.waiting)
+        resp = self.json_encoder.dumps(self.proxylist.waiting)
         return self.resp(start_resp, codes.OK, resp, content_type='application/json')
 
     def history(self, environ, start_resp):
-        qs = dict(parse_qsl(environ.get('QUERY_STRING', '')))
-        result = [PROXY_RESULT_TYPE[result.upper()] for result
-                  in qs.get('result', '').split(',') or ('success', 'fail', 'rest')]
-        search = tuple(set(token for token in token_group.split('+') if token)
-                       for token_group in qs.get('search', '').split() if token_group)
-        per_page = int(qs.get('per_page', 50))
-        start = ((int(qs['page']) - 1) * per_page) if 'page' in qs else None
+        qs = _parse_qs(environ)
+        result = frozenset(PROXY_RESULT_TYPE[result.upper()] for result
+                           in _parse_qs_list(qs, 'result', ('success', 'fail', 'rest')))
+        search = _parse_qs_search(qs)
+        start, per_page = _parse_qs_page(qs)
 
         iterable = chain(self.proxylist.active_proxies.values(),
                          self.proxylist.blacklist_proxies.values())
         history = []
         for p in iterable:
+            text = search and p.history and _proxy_search_text(p)
             for h in (p.history or []):
                 if (h[1] in result and  # result_type
-                    (not search or any(all((_match_proxy_search_token(p, token) or
+                    (not search or any(all((token in text or
                                            (h[2] and token in h[2]) or  # reason
                                            (h[3] and token in h[3]))  # request_ident
                                            for token in token_group)
                                        for token_group in search))):
                     history.append(tuple(h) + (p.addr, p.country))
 
-        history.sort(key=lambda h: h[0], reverse=True)
-        resp = self.proxylist.json_encoder.dumps({
-            'history': (history[start: start + per_page]
-                        if start is not None else history),
+        resp = self.json_encoder.dumps({
+            'history': _sort_page(history, itemgetter(0), True, start, per_page),
             'total': len(history),
         })
         return self.resp(start_resp, codes.OK, resp, content_type='application/json')
@@ -378,17 +538,27 @@ class WSGISuperProxy:
             raise ValueError('Required params not found: {}'.format(data))
         used_at_before = (datetime.utcnow() -
                           timedelta(seconds=timeparse(data['used_at_before'])))
-        for p in tuple(self.proxylist.blacklist_proxies.values()):
-            if p.used_at and used_at_before > p.used_at:
-                del self.proxylist.blacklist_proxies[p.addr]
+        blacklist_proxies = self.proxylist.blacklist_proxies
+        forget = []
+        for p in blacklist_proxies.values():
+            used_at = p.used_at
+            if used_at and used_at_before > used_at:
+                forget.append(p.addr)
+        for addr in forget:
+            del blacklist_proxies[addr]
 
     def action(self, environ, start_resp):
-        data = environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
-        data = json.loads(data.decode('utf-8'))
-
         def error(msg):
             return self.resp(start_resp, codes.UNPROCESSABLE, msg)
 
+        try:
+            # json.loads accepts utf-8 bytes, no need to decode body first
+            data = json.loads(_read_body(environ) or b'')
+        except ValueError as exc:
+            return error('Invalid JSON body: {}'.format(exc))
+        if not isinstance(data, dict) or 'action' not in data:
+            return error('Required params not found: {}'.format(data))
+
         if data['action'] in self.actions:
             try:
                 self.actions[data['action']](data)
@@ -407,19 +577,22 @@ class WSGISuperProxy:
                 self.actions_proxy[data['action']](proxy)
 
             elif 'status' in data or 'used_at_before' in data or 'used_at_after' in data:
-                status = ('status' in data and data['status'].split(',') or
-                          ('rest', 'active', 'blacklist'))
+                status = frozenset(data.get('status') and data['status'].split(',') or
+                                   ('rest', 'active', 'blacklist'))
+                now = datetime.utcnow()
                 used_at_before = (data.get('used_at_before') and
-                    datetime.utcnow() - timedelta(seconds=timeparse(data['used_at_before'])))
+                    now - timedelta(seconds=timeparse(data['used_at_before'])))
                 used_at_after = (data.get('used_at_after') and
-                    datetime.utcnow() - timedelta(seconds=timeparse(data['used_at_after'])))
-
-                for p in tuple(_iter_proxies_by_status(self.proxylist, status)):
-                    if used_at_before and p.used_at and used_at_before < p.used_at:
-                        continue
-                    if used_at_after and p.used_at and used_at_after > p.used_at:
+                    now - timedelta(seconds=timeparse(data['used_at_after'])))
+
+                action = self.actions_proxy[data['action']]
+                proxies = tuple(_iter_proxies_by_status(self.proxylist, status))
+                for p in proxies:
+                    used_at = p.used_at
+                    if used_at and ((used_at_before and used_at > used_at_before) or
+                                    (used_at_after and used_at < used_at_after)):
                         continue
-                    self.actions_proxy[data['action']](p)
+                    action(p)
 
             else:
                 return error('Required params not found: {}'.format(data))
@@ -427,6 +600,8 @@ class WSGISuperProxy:
         else:
             return error('Unknown action')
 
+        # so next status poll shows action result
+        self._status_cache = (0, None)
         return self.resp(start_resp, codes.OK, '{"status": "ok"}',
                          content_type='application/json')
 
@@ -434,39 +609,31 @@ class WSGISuperProxy:
         method = environ['REQUEST_METHOD']
         url = reconstruct_url(environ)
 
-        headers = {
-            key.title(): value
-            for key, value in (
-                # This is a hacky way of getting the header names right
-                (key[5:].replace('_', '-'), value)
-                for key, value in environ.items()
-                # Keys that start with HTTP_ are all headers
-                if key.startswith('HTTP_') and not key.startswith('HTTP_X_SUPERPROXY_')
-            )
-            if not is_hop_by_hop(key)
-        }
-        try:
-            headers['Content-Type'] = environ['CONTENT_TYPE']
-        except KeyError:
-            pass
+        headers, kwargs = {}, {}
+        # Single pass on environ, keys that start with HTTP_ are all headers
+        for key, value in environ.items():
+            if key[:5] != 'HTTP_':
+                continue
+            if key[:18] == 'HTTP_X_SUPERPROXY_':
+                kwarg = SUPERPROXY_WSGI_KEYS.get(key)
+                if kwarg:
+                    kwargs[kwarg[0]] = kwarg[1](value)
+            elif key not in HOP_BY_HOP_WSGI_KEYS:
+                headers[_wsgi_key_to_header(key)] = value
+        content_type = environ.get('CONTENT_TYPE')
+        if content_type:
+            headers['Content-Type'] = content_type
 
+        data = _read_body(environ)
+
+        # Deadline of all retries including backoff sleeps between them,
+        # proxy_* options not passed in headers are session defaults
+        options = dict(getattr(self.session, 'proxy_kwargs', {}), **kwargs)
+        deadline = (kwargs.get('timeout', TIMEOUT_DEFAULT) *
+                    options.get('proxy_max_retries', PROXY_MAX_RETRIES_DEFAULT) +
+                    proxy_retry_backoff_max(options))
         try:
-            data = environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
-        except (KeyError, ValueError):
-            data = None
-
-        kwargs = {
-            key: SUPERPROXY_REQUEST_HEADERS[key][0](value)
-            for key, value in (
-                (key[18:].lower(), value)
-                for key, value in environ.items()
-                if key.startswith('HTTP_X_SUPERPROXY_')
-            )
-            if key in SUPERPROXY_REQUEST_HEADERS
-        }
-        try:
-            with Timeout(kwargs.get('timeout', TIMEOUT_DEFAULT) *
-                         kwargs.get('proxy_max_retries', PROXY_MAX_RETRIES_DEFAULT)):
+            with Timeout(deadline):
                 resp = self.session.request(method, url, data=data, headers=headers, **kwargs)
         except BaseException as exc:
             logger.error('%r', exc)
@@ -474,17 +641,15 @@ class WSGISuperProxy:
             exc_args = tuple(str(arg) for arg in getattr(exc, 'args', ['_NO_ARGS']))
             return self.resp(
                 start_resp, codes.INTERNAL_SERVER_ERROR,
-                self.proxylist.json_encoder.dumps((exc_path,) + exc_args),
+                self.json_encoder.dumps((exc_path,) + exc_args),
                 headers=[('X-Superproxy-Error', exc.__class__.__name__)]
             )
 
-        headers = []
+        # Requests merge same header (set-cookie for example), so using raw headers
         # http://docs.python-requests.org/en/master/user/quickstart/#response-headers
-        for k in resp.headers:
-            if not is_hop_by_hop(k) and k.lower() not in ('content-length',):
-                for v in resp.raw.headers.getheaders(k):
-                    # Requests merge same header (set-cookie for example), see link above
-                    headers.append((k, v))
+        # iteritems yields each value of same header separately
+        headers = [(k, v) for k, v in resp.raw.headers.iteritems()
+                   if k.lower() not in HOP_BY_HOP_AND_LENGTH_HEADERS]
 
         headers += [
             ('X-Superproxy-Addr', resp._proxy and resp._proxy.addr or ''),
@@ -495,13 +660,15 @@ class WSGISuperProxy:
         return self.resp(start_resp, '{0.status_code} {0.reason}'.format(resp),
                          resp.content, headers=headers)
 
-    def resp(self, start_resp, status, content='', headers=[], content_type=None):
+    def resp(self, start_resp, status, content='', headers=None, content_type=None):
         if isinstance(status, int):
-            status = '{} {}'.format(status, STATUS_CODE_TITLES[status])
+            status = STATUS_LINES[status]
         if not isinstance(content, bytes):
             content = str(content).encode('utf-8')
-        if content_type:
-            headers = list(headers) + [('Content-Type', content_type)]
 
-        start_resp(status, headers + [('Content-Length', str(len(content)))])
+        headers = list(headers) if headers else []
+        if content_type:
+            headers.append(('Content-Type', content_type))
+        headers.append(('Content-Length', str(len(content))))
+        start_resp(status, headers)
         return [content]
@@ -1,6 +1,5 @@
 import logging
 import os
-import io
 import json
 import enum
 import random
@@ -8,6 +7,7 @@ from datetime import datetime, date, time
 import time as time_
 from urllib.parse import quote, unquote
 from importlib import import_module
+from functools import lru_cache
 from shutil import which
 try:
     from collections.abc import Mapping
@@ -15,19 +15,19 @@ except ImportError:
     # before Python 3.3
     from collections import Mapping
 
-from gevent.subprocess import run, PIPE
+from gevent.subprocess import Popen, PIPE, CalledProcessError
 
 
 def repr_response(resp, full=False):
     """
     Helper function requests.Response representation.
     """
-    if not full and len(resp.content) > 128:
-        content = '{}...{}b'.format(resp.content[:128], len(resp.content))
-    else:
-        content = resp.content
     if 300 <= resp.status_code < 400:
         content = resp.headers.get('Location')
+    else:
+        content = resp.content
+        if not full and len(content) > 128:
+            content = '{}...{}b'.format(content[:128], len(content))
     return '{} {} {}: {}'.format(resp.request.method, resp.status_code,
                                  resp.url, content)
 
@@ -44,29 +44,35 @@ class ResponseMatch:
         (self.status, self.status_not, self.text, self.text_not,
          self.header, self.header_not) = \
             (status, status_not, text, text_not, header, header_not)
+        # (name, text or None) pairs, so headers are not unpacked on each call
+        self._header = [(h[0], h[1] if len(h) > 1 else None) for h in header]
+        self._header_not = [(h[0], h[1] if len(h) > 1 else None) for h in header_not]
 
     def __call__(self, resp):
         if self.status and resp.status_code not in self.status:
             return False
         if resp.status_code in self.status_not:
             return False
-        if self.text and not any(x in resp.text for x in self.text):
-            return False
-        if any(x in resp.text for x in self.text_not):
-            return False
-        for header, *header_text in self.header:
-            if header not in resp.headers:
+        if self.text or self.text_not:
+            # resp.text decodes (and may detect encoding of) content on each access
+            text = resp.text
+            if self.text and not any(x in text for x in self.text):
+                return False
+            if any(x in text for x in self.text_not):
+                return False
+        for header, header_text in self._header:
+            value = resp.headers.get(header)
+            if value is None or (header_text is not None and header_text not in value):
                 return False
-            elif header_text and not header_text[0] in resp.headers[header]:
+        for header, header_text in self._header_not:
+            value = resp.headers.get(header)
+            if value is not None and (header_text is None or header_text in value):
                 return False
-        for header, *header_text in self.header_not:
-            if header in resp.headers:
-                if not header_text or header_text[0] in resp.headers[header]:
-                    return False
         return True
 
     def _to_superproxy_header(self):
-        return quote(json.dumps({k: v for k, v in self.__dict__.items() if v}))
+        return quote(json.dumps({k: v for k, v in self.__dict__.items()
+                                 if v and not k.startswith('_')}))
 
     @classmethod
     def _from_superproxy_header(cls, data):
@@ -94,6 +100,12 @@ def create_country_name_to_alpha2():
         import WIKIPEDIA_COUNTRY_NAME_TO_COUNTRY_ALPHA2
 
     rv = {k.upper(): v for k, v in WIKIPEDIA_COUNTRY_NAME_TO_COUNTRY_ALPHA2.items()}
+    for country in countries:
+        for attr in ('name', 'common_name', 'official_name'):
+            name = getattr(country, attr, None)
+            if name:
+                rv[name.upper()] = country.alpha_2
+    # Manual fixes last, so they're not overwritten by pycountry names
     rv.update({
         'KOREA': 'KR',
         'REPUBLIC OF KOREA': 'KR',
@@ -103,23 +115,24 @@ def create_country_name_to_alpha2():
         'CURACAO': 'CW',
         'UNKNOWN': None,
     })
-    for country in countries:
-        for attr in ('name', 'common_name', 'official_name'):
-            name = getattr(country, attr, None)
-            if name:
-                rv[name.upper()] = country.alpha_2
     return rv
 
 
 _COUNTRY_NAME_TO_ALPHA2 = {}
 
 
+@lru_cache(maxsize=1024)
+def _country_name_to_alpha2(name):
+    # Fetchers resolve same few country names for each proxy, skipping upper()
+    return _COUNTRY_NAME_TO_ALPHA2[name.upper()]
+
+
 def country_name_to_alpha2(name, raise_error=True):
     if not _COUNTRY_NAME_TO_ALPHA2:
         # lazy population
         _COUNTRY_NAME_TO_ALPHA2.update(create_country_name_to_alpha2())
     try:
-        return _COUNTRY_NAME_TO_ALPHA2[name.upper()]
+        return _country_name_to_alpha2(name)
     except KeyError:
         if raise_error:
             raise
@@ -174,16 +187,35 @@ class classproperty(property):
 def to_isoformat(dt):
     if dt.tzinfo:
         return dt.isoformat()
-    # assuming we operate naive datetimes in utc
-    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    # assuming we operate naive datetimes in utc,
+    # same as strftime('%Y-%m-%dT%H:%M:%SZ'), but ~2x faster
+    return dt.isoformat(timespec='seconds') + 'Z'
 
 
 def from_isoformat(dt):
     # TODO: Try to use dateutil.parser.parse for times generated
     # not from our code, as optional depency
+    if len(dt) == 20 and dt[10] == 'T' and dt[19] == 'Z':
+        # format produced by to_isoformat, fromisoformat is much faster than strptime
+        # and gives naive datetime without "Z"
+        return datetime.fromisoformat(dt[:19])
     return datetime.strptime(dt, '%Y-%m-%dT%H:%M:%SZ')
 
 
+def _datetime_to_json(dt):
+    # assuming naive datetimes in UTC
+    if dt.tzinfo is None:
+        return to_isoformat(dt)
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+JSON_TYPE_ENCODERS = {
+    datetime: _datetime_to_json,
+    date: date.isoformat,
+    time: time.isoformat,
+}
+
+
 class JSONEncoder(json.JSONEncoder):
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('indent', 2)
@@ -191,9 +223,12 @@ class JSONEncoder(json.JSONEncoder):
         super().__init__(*args, **kwargs)
 
     def default(self, obj):
+        # exact type lookup first, isinstance checks below are for subclasses
+        encoder = JSON_TYPE_ENCODERS.get(type(obj))
+        if encoder:
+            return encoder(obj)
         if isinstance(obj, datetime):
-            # assuming naive datetimes in UTC
-            return obj.strftime('%Y-%m-%dT%H:%M:%SZ')
+            return _datetime_to_json(obj)
         if isinstance(obj, (date, time)):
             return obj.isoformat()
         if isinstance(obj, enum.Enum):
@@ -207,22 +242,18 @@ class JSONEncoder(json.JSONEncoder):
         super().default(obj)
 
     def dump(self, obj, fp):
-        iterator = self.iterencode(obj)
+        # Encoding before opening, so file is not truncated if encoding fails,
+        # single write is faster than writing each small chunk
+        data = self.encode(obj)
         if isinstance(fp, str):
             with open(fp, 'w') as fp:
-                for chunk in iterator:
-                    fp.write(chunk)
+                fp.write(data)
         else:
-            for chunk in iterator:
-                fp.write(chunk)
+            fp.write(data)
 
     def dumps(self, obj):
-        buf = io.StringIO()
-        try:
-            self.dump(obj, buf)
-            return buf.getvalue()
-        finally:
-            buf.close()
+        # one-shot encode, C encoder is used by stdlib if indent is None
+        return self.encode(obj)
 
 
 def str_to_enum(value, enum_cls):
@@ -258,12 +289,9 @@ def get_subclasses_from_module(module, cls):
         if attr.startswith('_'):
             continue
         obj = getattr(module, attr)
-        try:
-            if issubclass(obj, cls) and obj is not cls:
-                rv.append(obj)
-        except TypeError:
-            # issubclass() arg 1 must be a class skip
-            pass
+        # issubclass() arg 1 must be a class, checking it instead of catching TypeError
+        if isinstance(obj, type) and issubclass(obj, cls) and obj is not cls:
+            rv.append(obj)
     return rv
 
 
@@ -291,21 +319,35 @@ COMMON_USER_AGENTS = [
 ]
 
 
-def get_random_user_agent(filter_=None):
+@lru_cache(maxsize=None)
+def _get_user_agents():
     # https://techblog.willshouse.com/2012/01/03/most-common-user-agents/
     # Updated December 14th 2018
-    if not hasattr(get_random_user_agent, '_user_agents'):
-        with open(os.path.dirname(__file__) + '/user_agents.txt') as fh:
-            get_random_user_agent._user_agents = [
-                x.strip() for x in fh.readlines()
-                if x.strip() and not x.strip().startswith('#')
-            ]
+    with open(os.path.dirname(__file__) + '/user_agents.txt') as fh:
+        return tuple(ua for ua in (x.strip() for x in fh)
+                     if ua and not ua.startswith('#'))
+
+
+def get_random_user_agent(filter_=None):
+    # filtering on each call, so cache is not populated with different filter functions
     if filter_:
-        return random.choice([ua for ua in get_random_user_agent._user_agents if filter_(ua)])
-    return random.choice(get_random_user_agent._user_agents)
+        return random.choice([ua for ua in _get_user_agents() if filter_(ua)])
+    return random.choice(_get_user_agents())
 
 
 def gocr_response(resp, pattern, convert=which('convert'), gocr=which('gocr')):
-    cmd = run('{} - pbm:- | {} -C "{}" -'.format(convert, gocr, pattern),
-              stdout=PIPE, input=resp.content, shell=True, check=True)
-    return cmd.stdout.strip().decode()
+    # Piping processes directly, without shell process and pattern quoting
+    convert_proc = Popen([convert, '-', 'pbm:-'], stdin=PIPE, stdout=PIPE)
+    gocr_proc = Popen([gocr, '-C', pattern, '-'], stdin=convert_proc.stdout, stdout=PIPE)
+    convert_proc.stdout.close()  # so convert gets SIGPIPE if gocr exits
+    try:
+        convert_proc.stdin.write(resp.content)
+        convert_proc.stdin.close()
+    except BrokenPipeError:
+        pass  # convert exited early, error is raised by returncode below
+    stdout = gocr_proc.communicate()[0]
+    convert_proc.wait()
+    for proc in (gocr_proc, convert_proc):
+        if proc.returncode:
+            raise CalledProcessError(proc.returncode, proc.args, stdout)
+    return stdout.strip().decode()
@@ -0,0 +1,55 @@
+from proxytools.models import Proxy
+from proxytools.proxylist import ProxyList
+
+
+def _proxylist(max_simultaneous):
+    proxylist = ProxyList(min_size=1, max_fail=10, max_simultaneous=max_simultaneous)
+    proxy = Proxy('127.0.0.1:8080', ['HTTP'])
+    proxylist.proxy(proxy)
+    return proxylist, proxy
+
+
+def _use(proxylist, proxy, count):
+    # take proxy while it's ready, returns how many times it was taken
+    taken = 0
+    while taken < count and proxy.addr in proxylist.get_ready_proxies():
+        proxy.in_use += 1
+        taken += 1
+    return taken
+
+
+def test_simultaneous_default():
+    proxylist, proxy = _proxylist(2)
+    assert _use(proxylist, proxy, 3) == 2
+    proxylist.fail(proxy)
+    assert proxylist.simultaneous == {proxy.addr: 1}
+    assert proxy.addr not in proxylist.get_ready_proxies()
+    proxylist.success(proxy)
+    assert proxylist.simultaneous == {}
+    assert _use(proxylist, proxy, 3) == 2
+
+
+def test_simultaneous_aimd():
+    proxylist, proxy = _proxylist(8)
+    assert _use(proxylist, proxy, 8) == 8
+    for limit in (4, 2, 1, 1):
+        proxylist.fail(proxy)
+        assert proxylist.simultaneous[proxy.addr] == limit
+    assert proxy.in_use == 4
+    proxylist.release(proxy)
+    proxylist.release(proxy)
+    proxylist.release(proxy)
+    assert _use(proxylist, proxy, 8) == 0
+    proxylist.release(proxy)
+    assert _use(proxylist, proxy, 8) == 1
+
+    # additive increase, limit is restored one by one
+    for limit in (2, 3, 4, 5, 6, 7):
+        proxylist.success(proxy)
+        assert proxylist.simultaneous[proxy.addr] == limit
+        _use(proxylist, proxy, 8)
+        assert proxy.in_use == limit
+    proxylist.success(proxy)
+    assert proxylist.simultaneous == {}
+    _use(proxylist, proxy, 8)
+    assert proxy.in_use == 8
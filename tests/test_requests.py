@@ -1,11 +1,21 @@
+import re
 import time
+from urllib.parse import urljoin
 
+import pytest
 from gevent.pool import Pool
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.models import Response
+from requests.sessions import Session
 
+from proxytools import requests as proxytools_requests
+from proxytools.exceptions import InsufficientProxies, ProxyMaxRetriesExceeded
 from proxytools.proxylist import ProxyList
 from proxytools.proxychecker import ProxyChecker
 from proxytools.proxyfetcher import ProxyFetcher
-from proxytools.requests import ProxyListSession
+from proxytools.requests import (ProxyListSession, BaseUrlSession, RegexpMountSession,
+                                 SharedMountSession, ProxyListMixin, SuperProxySession)
 
 
 def test_proxylist_session():
@@ -28,6 +38,290 @@ def test_proxylist_session():
     pool.join()
 
 
+@pytest.mark.parametrize('base_url', ['http://a/b/', 'http://a/b/c?q=1#f', 'http://a'])
+@pytest.mark.parametrize('url', [
+    'd', 'd/e?f=1#g', 'd//e', 'd/./e', 'd/../e', 'd/e/..', 'd:e', 'd/e:f', '/d', '//d/e',
+    '?q=2', '#g', '.', '..', '', 'http://x/y', 'd?u=http://x/y',
+])
+def test_base_url(monkeypatch, base_url, url):
+    monkeypatch.setattr(Session, 'request', lambda self, method, url, **kwargs: url)
+    session = BaseUrlSession(base_url)
+    assert session.request('GET', url) == urljoin(base_url, url)
+
+
+def _regexp_session(*patterns):
+    # adapter per mounted pattern, in mount order
+    adapters = [HTTPAdapter() for _ in patterns]
+    return RegexpMountSession(dict(zip(patterns, adapters))), adapters
+
+
+def test_regexp_mount_order():
+    session, (a, b, c) = _regexp_session(r'http://\w+\.com', r'http://a\.\w+', r'.*')
+    assert session.get_adapter('http://a.com/') is a
+    assert session.get_adapter('http://a.org/') is b
+    assert session.get_adapter('ftp://a.org/') is c
+
+
+def test_regexp_mount_prefix_precedence():
+    session, (a, b, c) = _regexp_session(r'http://\w+\.com', 'http://a.', r'https?://a')
+    # prefix mounted later than matching regexp
+    assert session.get_adapter('http://a.com/') is a
+    # prefix mounted earlier than matching regexp
+    assert session.get_adapter('http://a.org/') is b
+    assert session.get_adapter('https://a.org/') is c
+    assert session.get_adapter('https://b.org/') is session.adapters['https://']
+
+
+def test_regexp_mount_backreference():
+    session, (a, b) = _regexp_session(r'https?://(a)\1\.com', r'(http)://(\w)\2\.com')
+    assert session.get_adapter('http://aa.com/') is a
+    assert session.get_adapter('http://bb.com/') is b
+    assert session.get_adapter('http://ab.com/') is session.adapters['http://']
+
+
+def test_regexp_mount_named_groups():
+    session, (a, b) = _regexp_session(r'http://(?P<h>a)\.com', r'http://(?P<h>\w+)\.org')
+    assert session.get_adapter('http://a.com/') is a
+    assert session.get_adapter('http://a.org/') is b
+
+
+def test_regexp_mount_global_flags():
+    session, (a, b) = _regexp_session(r'(?i)http://A\.com', r'http://\w+\.com')
+    assert session.get_adapter('http://a.com/') is a
+    assert session.get_adapter('http://b.com/') is b
+
+
+def test_regexp_mount_ascii():
+    session, (a, b) = _regexp_session(re.compile(r'http://\w+\.x', re.ASCII), r'http://\w+\.x')
+    assert session.get_adapter('http://ab.x/') is a
+    assert session.get_adapter('http://éé.x/') is b
+
+
+def test_regexp_mount_verbose():
+    session, (a, b) = _regexp_session(re.compile(r'http://a\.com  # a', re.VERBOSE), r'http://')
+    assert session.get_adapter('http://a.com/') is a
+    assert session.get_adapter('http://b.com/') is b
+
+
+@pytest.mark.parametrize('url', ['http://aa/', 'http://a.org/', 'http://b.com/', 'http://b/'])
+def test_regexp_mount_same_as_sequential(url):
+    patterns = [r'http://(a)\1', r'http://a\.', r'(?P<x>http)://\w+\.com', r'\w+://b']
+    session, adapters = _regexp_session(*patterns)
+    expected = next(adapter for pattern, adapter in zip(patterns, adapters)
+                    if re.match(pattern, url))
+    assert session.get_adapter(url) is expected
+
+
+def test_regexp_mount_group_offsets():
+    # inner groups shift outer group numbers of following patterns
+    session, (a, b, c) = _regexp_session(r'http://(a)(b)?\.com', r'http://((c)|d)\.com', r'http://e')
+    assert session.get_adapter('http://ab.com/') is a
+    assert session.get_adapter('http://c.com/') is b
+    assert session.get_adapter('http://d.com/') is b
+    assert session.get_adapter('http://e.com/') is c
+
+
+def test_regexp_mount_shared():
+    class Session(SharedMountSession, RegexpMountSession):
+        pass
+
+    a, b = HTTPAdapter(), HTTPAdapter()
+    session1 = Session(regexp_adapters={r'http://(a)\.com': a})
+    session2 = Session()
+    assert session2.get_adapter('http://a.com/') is a
+    # mounted on one session is visible on another, index is updated inplace
+    session2.regexp_mount(r'http://(\w)\1\.com', b)
+    assert session1._regexp_adapters_index is session2._regexp_adapters_index
+    assert session1.get_adapter('http://bb.com/') is b
+    assert session1.get_adapter('http://a.com/') is a
+    assert session2.regexp_unmount(r'http://(a)\.com') is a
+    assert session1.get_adapter('http://a.com/') is session1.adapters['http://']
+    assert list(session1.regexp_adapters) == [re.compile(r'http://(\w)\1\.com')]
+
+
+def test_regexp_unmount():
+    session, (a, b) = _regexp_session(r'http://\w+\.com', 'http://a.')
+    with pytest.raises(TypeError):
+        session.regexp_adapters[re.compile('.*')] = a
+    assert session.regexp_unmount(re.compile(r'http://\w+\.com')) is a
+    assert session.get_adapter('http://a.com/') is b
+    assert session.regexp_unmount('http://a.') is b
+    assert session.get_adapter('http://a.com/') is session.adapters['http://']
+    with pytest.raises(KeyError):
+        session.regexp_unmount('http://a.')
+
+
+class StubProxy:
+    def __init__(self, addr):
+        self.addr = addr
+        self.url = 'http://' + addr
+
+
+class StubProxyList:
+    """
+    Returns first not excluded proxy (or persist one) and records calls.
+    """
+    def __init__(self, *addrs):
+        self.proxies = [StubProxy(addr) for addr in addrs]
+        self.calls = []
+
+    def _get_fastest(self):
+        pass
+
+    def get(self, strategy, exclude=(), persist=None, request_ident=None, **kwargs):
+        self.calls.append(('get', persist or None))
+        for proxy in self.proxies:
+            if proxy.addr == persist and persist not in exclude:
+                return proxy
+        for proxy in self.proxies:
+            if proxy.addr not in exclude:
+                return proxy
+        raise InsufficientProxies()
+
+    def success(self, proxy, **kwargs):
+        self.calls.append(('success', proxy.addr))
+
+    def fail(self, proxy, **kwargs):
+        self.calls.append(('fail', proxy.addr))
+
+    def rest(self, proxy, **kwargs):
+        self.calls.append(('rest', proxy.addr))
+
+    def release(self, proxy):
+        self.calls.append(('release', proxy.addr))
+
+
+class StubProxyListSession(ProxyListMixin, Session):
+    """
+    Returns (or raises) next result instead of sending request.
+    """
+    def __init__(self, proxylist, results=(), **kwargs):
+        self.results = list(results)
+        super().__init__(proxylist, 'request', **kwargs)
+
+    def request(self, method, url, **kwargs):
+        result = self.results.pop(0) if self.results else Response()
+        if callable(result):
+            result = result()
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+
+def test_proxy_affinity():
+    proxylist = StubProxyList('1', '2')
+    session = StubProxyListSession(proxylist, proxy_affinity=True)
+    assert session.get('http://a.com/x')._proxy.addr == '1'
+    assert session._affinity == {'a.com': '1'}
+    assert session.get('http://a.com/y')._proxy.addr == '1'
+    assert proxylist.calls[-2] == ('get', '1')
+
+    # failed affinity proxy is forgotten
+    session.results = [ConnectionError()]
+    assert session.get('http://a.com/z')._proxy.addr == '2'
+    assert session._affinity == {'a.com': '2'}
+    assert ('fail', '1') in proxylist.calls
+
+
+def test_proxy_affinity_concurrent_fail():
+    proxylist = StubProxyList('1', '2')
+    session = StubProxyListSession(proxylist, proxy_affinity=True, proxy_max_retries=1)
+
+    def fail():
+        # other request succeeded with another proxy meanwhile
+        session._set_affinity('a.com', '2')
+        return ConnectionError()
+    session.results = [fail]
+    with pytest.raises(ProxyMaxRetriesExceeded):
+        session.get('http://a.com/')
+    assert session._affinity == {'a.com': '2'}
+
+
+def test_proxy_affinity_lru(monkeypatch):
+    monkeypatch.setattr(proxytools_requests, 'PROXY_AFFINITY_MAX_SIZE', 2)
+    session = StubProxyListSession(StubProxyList('1'), proxy_affinity=True)
+    session.get('http://a.com/')
+    session.get('http://b.com/')
+    session.get('http://a.com/')
+    session.get('http://c.com/')
+    assert list(session._affinity) == ['a.com', 'c.com']
+
+
+def test_proxy_affinity_persist_precedence():
+    proxylist = StubProxyList('1', '2')
+    session = StubProxyListSession(proxylist, proxy_affinity=True)
+    session.get('http://a.com/')
+    assert session.get('http://a.com/', proxy_persist='2')._proxy.addr == '2'
+    assert proxylist.calls[-2] == ('get', '2')
+    # affinity is updated with persist proxy
+    session.get('http://a.com/')
+    assert proxylist.calls[-2] == ('get', '2')
+
+
+def test_proxy_retry_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(proxytools_requests, 'sleep', sleeps.append)
+    monkeypatch.setattr(proxytools_requests.random, 'random', lambda: 1.0)
+    session = StubProxyListSession(StubProxyList('1', '2', '3', '4', '5'),
+                                   proxy_retry_base=1, proxy_retry_cap=3,
+                                   proxy_retry_jitter=0.5, proxy_max_retries=5)
+    session.results = [ConnectionError()] * 4
+    assert session.get('http://a.com/')._proxy.addr == '5'
+    # min(cap, base * 2 ** n) * (1 + jitter), first attempt is not delayed
+    assert sleeps == [1.5, 3, 4.5, 4.5]
+
+    sleeps.clear()
+    assert session.get('http://a.com/')._proxy.addr == '1'
+    assert sleeps == []
+
+
+def test_proxy_retry_backoff_disabled(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(proxytools_requests, 'sleep', sleeps.append)
+    session = StubProxyListSession(StubProxyList('1', '2', '3'))
+    session.results = [ConnectionError()] * 2
+    assert session.get('http://a.com/')._proxy.addr == '3'
+    assert sleeps == []
+
+
+def test_proxy_not_proxy_error_releases():
+    proxylist = StubProxyList('1', '2')
+    session = StubProxyListSession(proxylist, results=[ValueError('bad')])
+    with pytest.raises(ValueError):
+        session.get('http://a.com/')
+    assert proxylist.calls == [('get', None), ('release', '1')]
+
+
+def test_proxy_error_fails_and_retries():
+    proxylist = StubProxyList('1', '2')
+    session = StubProxyListSession(proxylist, results=[ConnectionError()])
+    resp = session.get('http://a.com/')
+    assert resp._proxy.addr == '2'
+    assert resp._fail_count == 1
+    assert proxylist.calls == [('get', None), ('fail', '1'), ('get', None), ('success', '2')]
+
+
+def test_superproxy_session_headers(monkeypatch):
+    sent = []
+
+    def request(self, method, url, headers=None, **kwargs):
+        sent.append(headers)
+        resp = Response()
+        resp.headers['X-Superproxy-Addr'] = '127.0.0.1:8080'
+        return resp
+    monkeypatch.setattr(Session, 'request', request)
+    session = SuperProxySession('http://localhost:8088', proxy_persist=True,
+                                proxy_max_retries=2)
+    caller_headers = {'Accept': 'text/html'}
+    session.get('http://a.com/', headers=caller_headers, proxy_exclude=['1', '2'])
+    session.get('http://a.com/')
+    assert sent == [
+        {'Accept': 'text/html', 'X-Superproxy-Proxy-Max-Retries': '2',
+         'X-Superproxy-Proxy-Exclude': '1,2'},
+        {'X-Superproxy-Proxy-Max-Retries': '2', 'X-Superproxy-Proxy-Persist': '127.0.0.1:8080'},
+    ]
+    assert caller_headers == {'Accept': 'text/html'}
+
 # TODO: test SuperProxy wsgi app instead of server,
 # run it in tests with different configurations,
 # monkey patch actual request sending
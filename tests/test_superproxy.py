@@ -0,0 +1,178 @@
+import io
+import json
+from base64 import b64encode
+from datetime import datetime, timedelta
+
+import pytest
+
+from proxytools.models import Proxy
+from proxytools.proxylist import ProxyList
+from proxytools import superproxy
+from proxytools.superproxy import WSGISuperProxy, _accepts_gzip
+from proxytools.utils import JSONEncoder
+
+
+def _call(app, path, environ={}):
+    # returns status, headers and body of WSGI response
+    started = {}
+
+    def start_resp(status, headers):
+        started.update(status=status, headers=dict(headers))
+    environ = dict({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+                    'REMOTE_ADDR': '127.0.0.1'}, **environ)
+    body = b''.join(app(environ, start_resp))
+    return started['status'], started['headers'], body
+
+
+def _post_action(app, data):
+    body = json.dumps(data).encode('utf-8')
+    return _call(app, '/action', {'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(body)),
+                                  'wsgi.input': io.BytesIO(body)})
+
+
+@pytest.mark.parametrize('accept_encoding,expected', [
+    ('', False),
+    ('gzip', True),
+    ('gzip, deflate, br', True),
+    ('deflate, GZIP;q=0.5', True),
+    ('x-gzip', True),
+    ('*', True),
+    ('gzip;q=0', False),
+    ('gzip; q=0.0, deflate', False),
+    ('gzip;q=0, *', False),
+    ('*;q=0', False),
+    ('deflate', False),
+    ('gzipped', False),
+    ('identity, gzip;q=bad', False),
+])
+def test_accepts_gzip(accept_encoding, expected):
+    assert _accepts_gzip(accept_encoding) is expected
+
+
+def test_action_forget_blacklist():
+    proxylist = ProxyList(min_size=1)
+    now = datetime.utcnow()
+    for addr, used_at in (('127.0.0.1:1', None), ('127.0.0.1:2', now - timedelta(hours=2)),
+                          ('127.0.0.1:3', now)):
+        proxylist.blacklist(Proxy(addr, ['HTTP'], fail_at=used_at), load=True)
+    WSGISuperProxy(proxylist).action_forget_blacklist({'used_at_before': '1h'})
+    assert sorted(proxylist.blacklist_proxies) == ['127.0.0.1:1', '127.0.0.1:3']
+
+
+@pytest.mark.parametrize('environ,session_kwargs,expected', [
+    ({}, {}, 30),
+    ({'HTTP_X_SUPERPROXY_PROXY_MAX_RETRIES': '2'}, {}, 20),
+    # sleeps up to 5 * 1.5 and 10 * 1.5 between attempts
+    ({'HTTP_X_SUPERPROXY_PROXY_RETRY_BASE': '5'}, {}, 52.5),
+    ({'HTTP_X_SUPERPROXY_PROXY_RETRY_BASE': '5', 'HTTP_X_SUPERPROXY_PROXY_RETRY_CAP': '6',
+      'HTTP_X_SUPERPROXY_PROXY_RETRY_JITTER': '0'}, {}, 41),
+    ({}, {'proxy_retry_base': 1, 'proxy_max_retries': 4}, 40 + 1.5 + 3 + 6),
+])
+def test_proxy_deadline(monkeypatch, environ, session_kwargs, expected):
+    deadlines = []
+
+    class Timeout:
+        def __init__(self, seconds):
+            deadlines.append(seconds)
+
+        def __enter__(self):
+            pass
+
+        def __exit__(self, *exc_info):
+            pass
+
+    def request(*args, **kwargs):
+        raise ValueError('not sent')
+    monkeypatch.setattr(superproxy, 'Timeout', Timeout)
+    app = WSGISuperProxy(ProxyList(min_size=1), **session_kwargs)
+    monkeypatch.setattr(app.session, 'request', request)
+    status, headers, body = _call(app, 'http://a.com/', environ)
+    assert headers['X-Superproxy-Error'] == 'ValueError'
+    assert deadlines == [expected]
+
+
+def test_json_encoder():
+    class Encoder(JSONEncoder):
+        def encode(self, obj):
+            return 'custom'
+    # proxylist encoder is used by default
+    app = WSGISuperProxy(ProxyList(min_size=1, json_encoder=Encoder()))
+    assert _call(app, '/waiting')[2] == b'custom'
+    assert _call(app, '/status')[2] == b'custom'
+
+    app = WSGISuperProxy(ProxyList(min_size=1, json_encoder={'sort_keys': True}))
+    assert _call(app, '/status')[2].startswith(b'{\n  "actions": [')
+
+    app = WSGISuperProxy(ProxyList(min_size=1),
+                         json_encoder={'indent': None, 'separators': (',', ':')})
+    assert _call(app, '/waiting')[2] == b'{}'
+
+
+def test_status_cache_reset_on_action():
+    proxylist = ProxyList(min_size=1)
+    proxylist.proxy(Proxy('127.0.0.1:1', ['HTTP']))
+    app = WSGISuperProxy(proxylist)
+    assert json.loads(_call(app, '/status')[2])['blacklist'] == 0
+    assert _post_action(app, {'action': 'blacklist', 'addr': '127.0.0.1:1'})[0].startswith('200')
+    assert json.loads(_call(app, '/status')[2])['blacklist'] == 1
+
+
+def test_action_bulk_used_at():
+    proxylist = ProxyList(min_size=1)
+    now = datetime.utcnow()
+    for addr, used_at in (('127.0.0.1:1', None), ('127.0.0.1:2', now - timedelta(hours=2)),
+                          ('127.0.0.1:3', now - timedelta(minutes=30))):
+        proxylist.proxy(Proxy(addr, ['HTTP'], success_at=used_at))
+    app = WSGISuperProxy(proxylist)
+    status, _, body = _post_action(app, {'action': 'blacklist', 'status': 'active',
+                                         'used_at_before': '1h'})
+    assert status.startswith('200'), body
+    assert sorted(proxylist.blacklist_proxies) == ['127.0.0.1:1', '127.0.0.1:2']
+    _post_action(app, {'action': 'unblacklist', 'used_at_after': '3h'})
+    assert sorted(proxylist.blacklist_proxies) == []
+
+
+def _basic(username, password):
+    return 'Basic ' + b64encode('{}:{}'.format(username, password).encode('utf8')).decode()
+
+
+@pytest.mark.parametrize('authorization,expected', [
+    (None, '401'),
+    (_basic('admin', 'secret'), '200'),
+    (_basic('other', 'пароль'), '200'),
+    (_basic('admin', 'wrong'), '401'),
+    (_basic('admin', 'пароль'), '401'),
+    (_basic('admin', 'secret') + 'x', '401'),
+    ('Basic', '401'),
+    ('Basic ', '401'),
+    ('Basic  ' + _basic('admin', 'secret')[6:], '401'),
+    ('Bearer ' + _basic('admin', 'secret')[6:], '401'),
+    ('Basic not-base64-é', '401'),
+    ('', '401'),
+])
+def test_admin_authorization(authorization, expected):
+    app = WSGISuperProxy(ProxyList(min_size=1),
+                         admin_credentials={'admin': 'secret', 'other': 'пароль'})
+    environ = {} if authorization is None else {'HTTP_AUTHORIZATION': authorization}
+    status, headers, _ = _call(app, '/waiting', environ)
+    assert status[:3] == expected
+    if expected == '401':
+        assert headers['WWW-Authenticate'] == 'Basic realm=superproxy'
+
+
+@pytest.mark.parametrize('authorization,expected', [
+    (_basic('user', 'secret'), 'ValueError'),
+    (_basic('admin', 'secret'), 'Superproxy connection unauthorized'),
+    ('Basic', 'Superproxy connection unauthorized'),
+])
+def test_proxy_authorization(monkeypatch, authorization, expected):
+    def request(*args, **kwargs):
+        raise ValueError('not sent')
+    app = WSGISuperProxy(ProxyList(min_size=1), proxy_credentials={'user': 'secret'},
+                         admin_credentials={'admin': 'secret'})
+    monkeypatch.setattr(app.session, 'request', request)
+    # proxy authorization is passed in own header, not to be sent to target
+    status, headers, _ = _call(app, 'http://a.com/', {
+        'HTTP_X_SUPERPROXY_AUTHORIZATION': authorization,
+        'HTTP_AUTHORIZATION': _basic('admin', 'secret')})
+    assert headers['X-Superproxy-Error'] == expected
@@ -0,0 +1,9 @@
+from proxytools.utils import _get_user_agents, get_random_user_agent
+
+
+def test_get_random_user_agent():
+    assert get_random_user_agent() in _get_user_agents()
+    for _ in range(10):
+        assert 'Firefox' in get_random_user_agent(lambda ua: 'Firefox' in ua)
+    # only unfiltered user agents are cached, not filter functions
+    assert _get_user_agents.cache_info().currsize == 1